@@ -1,5 +1,9 @@
 import argparse
+import heapq
+import itertools
 import pickle
+import sys
+from operator import attrgetter
 
 
 class Heap:
@@ -11,120 +15,42 @@ class Heap:
             sorting_key: Specifies the attribute of the object inserted
             into the heap, on the basis of which the heap was created.
         """
+        # Entries are [negated key, insertion counter, element] lists kept
+        # in min-heap order by heapq, so that tuple comparison (which runs
+        # in C) replaces per-compare getattr calls on the elements
+        # themselves. The counter breaks ties so two entries never compare
+        # by their element slot.
         self.heap = list()
         self.mapping = dict()
         self.sorting_key = sorting_key
+        # Bound once so key extraction goes through attrgetter's C path
+        # instead of a string-based getattr on every insert
+        self._key = attrgetter(sorting_key)
+        self.counter = itertools.count()
+
+    def __len__(self):
+        """Returns the number of live (non-stale) elements in the heap."""
+        return len(self.mapping)
 
     ##########################################################################
     # STANDARD HEAP OPERATIONS
     ##########################################################################
 
-    def heapify_up(self, child):
-        """Standard heapify operation, as described in CLRS.
-        Works by swapping the element originially at index child in the heap
-        with its parent until the heap property is satisfied. Modifies the
-        appropriate heap attribute
-
-        Args:
-            child: Index of the element that violates the heap property
-
-        Returns:
-            None
-        """
-        parent = (child - 1) / 2
-        # Swaps the element originally at the index child with its parent
-        # until the value of the specifed attribute of the parent is greater
-        # than the value of the specified attribute of the element itself
-        while (getattr(self.heap[parent], self.sorting_key) <
-               getattr(self.heap[child], self.sorting_key)):
-            if (parent == -1):
-                # This means child was 0, which means we have reached the
-                # top of the heap
-                return
-
-            # Swap the mappings as well to ensure that future references in
-            # the mapping dict refer to the correct position of the object in
-            # the heap
-            self.mapping[self.heap[parent].player] = child
-            self.mapping[self.heap[child].player] = parent
-
-            # Swap the parent and the child
-            temp = self.heap[parent]
-            self.heap[parent] = self.heap[child]
-            self.heap[child] = temp
-
-            # Move the child and parent pointers up the heap
-            child = parent
-            parent = (child - 1) / 2
-
-    def heapify_down(self, parent):
-        """Same as heapify_up, but moves an element down instead of up.
-
-        Args:
-            parent: Index of the element that violates the heap property
-
-        Returns:
-            None
-        """
-        left = parent*2+1
-        right = parent*2+2
-        if(len(self.heap) <= left):
-            return
-        elif(len(self.heap) <= right):
-            child = left
-        elif (getattr(self.heap[left], self.sorting_key) > getattr(self.heap[right], self.sorting_key)):
-            child = left
-        else:
-            child = right
-        while (getattr(self.heap[parent], self.sorting_key) < getattr(self.heap[child], self.sorting_key)):
-            if (child >= len(self.heap)):
-                # This means child was 0, which means we have reached the
-                # top of the heap
-                return
-
-            # Swap the mappings as well to ensure that future references in
-            # the mapping dict refer to the correct position of the object in
-            # the heap
-            self.mapping[self.heap[parent].player] = child
-            self.mapping[self.heap[child].player] = parent
-
-            # Swap the parent and the child
-            temp = self.heap[parent]
-            self.heap[parent] = self.heap[child]
-            self.heap[child] = temp
-
-            # Move the child and parent pointers up the heap
-            parent = child
-            left = parent*2+1
-            right = parent*2+2
-            if(len(self.heap) <= left):
-                break
-            elif(len(self.heap) <= right):
-                child = left
-            elif (getattr(self.heap[left], self.sorting_key) >  getattr(self.heap[right], self.sorting_key)):
-                child = left
-            else:
-                child = right
-
-
     def extract_max(self):
         """Returns the maximum element in the specified heap
 
         Returns:
             An object from the heap with maximum value of self.sorting_key
         """
-        if(len(self.heap) < 1):
-            return
-        #Take the max value
-        temp = self.heap[0]
-        #swap first and last values in heap
-        self.heap[0] = self.heap[len(self.heap) - 1]
-        self.heap[len(self.heap) - 1] = temp
-        #remove last output/max value from heap
-        output = self.heap.pop(len(self.heap) - 1)
-        #fix heap to satisfy invariant
-        self.heapify_down(0)
-        return output
+        # Pop entries until a live one is found; entries whose element slot
+        # was cleared by update() are stale and simply discarded here
+        while len(self.heap) > 0:
+            entry = heapq.heappop(self.heap)
+            element = entry[2]
+            if element is not None:
+                del self.mapping[element]
+                return element
+        return None
 
     def insert(self, element):
         """Inserts element into the specified heap. Modifies the internal heap
@@ -137,50 +63,45 @@ class Heap:
         Returns:
             None
         """
+        entry = [-self._key(element), next(self.counter), element]
+        self.mapping[element] = entry
+        heapq.heappush(self.heap, entry)
 
-        # Append the new element to the end of the heap, and then
-        # move the element up the heap as necessary
-        self.heap.append(element)
-        child = len(self.heap) - 1
-        self.mapping[element.player] = child
-
-        self.heapify_up(child)
-
-    def get_index(self, element):
-        """Returns the index of the provided element in the heap
+    def update(self, element):
+        """Re-keys an element already in the heap after its sorting_key
+        attribute changed. Uses lazy deletion: the old entry is marked stale
+        in place and a fresh entry is pushed, so no sifting of the old entry
+        is needed
 
         Args:
-            element: The element whose index needs to be returned
+            element: PlayerRecord object whose key attribute has changed
 
         Returns:
-            Index of the element in the heap if the element is in the heap
-            None, otherwise
+            None
         """
-        return self.mapping.get(element.player, None)
+        old_entry = self.mapping.get(element, None)
+        if old_entry is not None:
+            old_entry[2] = None
+        self.insert(element)
 
     def validate_heap(self):
-        """Validates that the heap specified by heap_name satisfies the heap
-        property at every node
+        """Validates that the heap satisfies the heap property at every node
 
         Returns:
             True if heap property is satisfied at every node of the heap,
             False otherwise
         """
-        heap = [getattr(ele, self.sorting_key) for ele in self.heap]
-        remaining_elements = [0]
+        heap = self.heap
         n = len(heap)
-        while (len(remaining_elements) != 0):
-            parent = remaining_elements.pop()
-            child1 = (2 * parent) + 1
-            child2 = (2 * parent) + 2
-            if (child1 < n):
-                remaining_elements.append(child1)
-                if (heap[child1] > heap[parent]):
-                    return False
-            if (child2 < n):
-                remaining_elements.append(child2)
-                if (heap[child2] > heap[parent]):
-                    return False
+        # Every index below n >> 1 has at least a left child, so a single
+        # linear sweep covers all parent/child edges without a work queue
+        for parent in range(n >> 1):
+            child = (2 * parent) + 1
+            if (heap[child] < heap[parent]):
+                return False
+            child += 1
+            if (child < n and heap[child] < heap[parent]):
+                return False
         return True
 
 
@@ -193,10 +114,12 @@ class PlayerRecord:
         player: Name of the player
         ab: Number of at-bats by the player
         hits: Number of 'hits' by the player
-        avg: Average number of hits = hits / ab
+        avg: Average number of hits = hits / ab, derived on demand
         rbi: Number of 'runs-batted-in' by the player
     """
 
+    __slots__ = ('player', 'ab', 'hits', 'rbi')
+
     def __init__(self, player, ab, hits, rbi):
         """Initializes a new instance of PlayerRecord, setting the
         various statistic values as provided
@@ -211,17 +134,47 @@ class PlayerRecord:
 
         self.ab = ab
         self.hits = hits
-        if ab == 0:
-            self.avg = 0.0
-        else:
-            self.avg = float(hits) / float(ab)
         self.rbi = rbi
 
+    @classmethod
+    def _make(cls, player, ab, hits, rbi):
+        """Builds a PlayerRecord with direct slot stores, bypassing the
+        __init__ call machinery on the hot new-player path
+
+        Args:
+            player: Name of the player
+            ab: Number of at-bats by the player
+            hits: Number of hits by the player
+            rbi: Number of rbis by the player
+
+        Returns:
+            A new PlayerRecord instance
+        """
+        record = object.__new__(cls)
+        record.player = player
+        record.ab = ab
+        record.hits = hits
+        record.rbi = rbi
+        return record
+
+    @property
+    def avg(self):
+        """Average number of hits per at-bat, computed when asked for
+        rather than stored, so stat updates pay no division."""
+        if self.ab == 0:
+            return 0.0
+        return float(self.hits) / float(self.ab)
+
     def __repr__(self):
         return '%s--Ab:%d, Hits:%d, Avg:%.3f, Rbi:%d' % (
             self.player, self.ab, self.hits, self.avg, self.rbi)
 
 
+# Shared record returned for players that are not in the database; callers
+# only read it, so one instance serves every miss
+_MISSING_RECORD = PlayerRecord(None, 1, 0, 0)
+
+
 class Problem:
 
     """Represents an instance of a problem. Implements operations required in
@@ -232,12 +185,21 @@ class Problem:
         object corresponding to the player
     """
 
+    # Key extractors for each statistic current_best can rank by
+    STAT_KEYS = {
+        'ab': attrgetter('ab'),
+        'hits': attrgetter('hits'),
+        'rbi': attrgetter('rbi'),
+        'avg': attrgetter('avg'),
+    }
+
     def __init__(self):
         self.player_record_mapping = dict()
-        self.abHeap = Heap('ab')
-        self.hitsHeap = Heap('hits')
-        self.rbiHeap = Heap('rbi')
-        self.avgHeap = Heap('avg')
+        # One-slot cache for the last player looked up; driver files are
+        # bursty, so consecutive operations often name the same player and
+        # can skip the dict probe entirely
+        self._last_name = None
+        self._last_rec = None
 
     ###########################################################################
     # Batting operations
@@ -246,9 +208,8 @@ class Problem:
     def new_at_bat(self, player, hits, rbi):
         """Represents the new_at_bat operation. Checks if the given player
         has been seen before, if so just updates the corresponding PlayerRecord
-        object (and corresponding heaps as well); otherwise creates a new
-        object of the PlayerRecord class corresponding to the new player
-        and adds this new object to all required heaps
+        object; otherwise creates a new object of the PlayerRecord class
+        corresponding to the new player
 
         Args:
             player: Name of the player whose record needs to created / updated
@@ -258,29 +219,27 @@ class Problem:
         Returns:
             None
         """
-        if player in self.player_record_mapping:
-            currentRecord = self.player_record_mapping[player]
+        if player == self._last_name:
+            currentRecord = self._last_rec
+        else:
+            currentRecord = self.player_record_mapping.get(player)
+        if currentRecord is not None:
+            self._last_name = player
+            self._last_rec = currentRecord
+            # ab always advances; hits and rbi frequently come in as 0, so
+            # skip those stores when nothing changed. avg is derived from
+            # ab and hits, so there is nothing further to refresh
             currentRecord.ab = currentRecord.ab + 1
-            currentRecord.hits = currentRecord.hits + hits
-            currentRecord.rbi = currentRecord.rbi + rbi
-            currentRecord.avg = float(currentRecord.hits)/float(currentRecord.ab)
-            self.player_record_mapping[player] = currentRecord
-            self.abHeap.heapify_up(self.abHeap.get_index(currentRecord))
-            self.hitsHeap.heapify_up(self.hitsHeap.get_index(currentRecord))
-            self.rbiHeap.heapify_up(self.rbiHeap.get_index(currentRecord))
-            if(hits == 0):
-                self.avgHeap.heapify_down(self.avgHeap.get_index(currentRecord))
-            else:
-                self.avgHeap.heapify_up(self.avgHeap.get_index(currentRecord))
+            if hits:
+                currentRecord.hits = currentRecord.hits + hits
+            if rbi:
+                currentRecord.rbi = currentRecord.rbi + rbi
         else:
-            playerRecord = PlayerRecord(player, 1, hits, rbi)
-            self.abHeap.insert(playerRecord)
-            self.hitsHeap.insert(playerRecord)
-            self.rbiHeap.insert(playerRecord)
-            self.avgHeap.insert(playerRecord)
-
+            playerRecord = PlayerRecord._make(player, 1, hits, rbi)
             self.player_record_mapping[player] = playerRecord
-            
+            self._last_name = player
+            self._last_rec = playerRecord
+
 
     def current_stats(self, player):
         """Represents the current_stats operation.
@@ -294,10 +253,14 @@ class Problem:
             PlayerRecord(None, 1, 0, 0) if the player name does not exist
             in the database.
         """
-        if player in self.player_record_mapping:
-            return self.player_record_mapping[player]
-        else:
-            return PlayerRecord(None, 1, 0, 0)
+        if player == self._last_name:
+            return self._last_rec
+        record = self.player_record_mapping.get(player)
+        if record is not None:
+            self._last_name = player
+            self._last_rec = record
+            return record
+        return _MISSING_RECORD
 
     def current_best(self, stat, k):
         """Represents the current_best operation.
@@ -312,28 +275,17 @@ class Problem:
             If k > n, a list of n PlayerRecord objects in decreasing order of
             the given statistic
         """
-        #Use the appropriate heap
-        theHeap = None;
-        if (stat == 'ab'):
-            theHeap = self.abHeap
-        elif(stat == 'hits'):
-            theHeap = self.hitsHeap
-        elif(stat == 'rbi'):
-            theHeap = self.rbiHeap
-        elif(stat == 'avg'):
-            theHeap = self.avgHeap
-        else:
-            print 'not valid'
+        if stat not in self.STAT_KEYS:
+            print('not valid')
             return
-        output = []
-        size = min(k, len(theHeap.heap))
-        #find k max statistics
-        for i in range(size):
-            output.append(theHeap.extract_max())
-        #reinsert k max statistics
-        for i in output:
-            theHeap.insert(i)
-        return output
+        records = self.player_record_mapping
+        # nlargest keeps a k-sized heap (n log k); once k grows toward n a
+        # single Timsort pass is cheaper. bit_length() stands in for log2
+        if k * k.bit_length() < len(records):
+            return heapq.nlargest(k, records.values(),
+                                  key=self.STAT_KEYS[stat])
+        return sorted(records.values(), key=self.STAT_KEYS[stat],
+                      reverse=True)[:k]
 
 
 def run(filename, debug=False):
@@ -343,10 +295,48 @@ def run(filename, debug=False):
     Args:
         filename: File path of the test driver file
     """
+    # Hand the open file straight through; run_from_list consumes any
+    # iterable of lines one at a time, so only the results accumulate in
+    # memory while the driver streams
     with open(filename, 'r') as f:
-        lines = f.readlines()
-        return run_from_list(lines, debug)
-    return None
+        return run_from_list(f, debug)
+
+
+# Per-operation handlers for run_from_list; dispatched by token 0:
+# 1. n -- new_at_bat(player, hits, rbi)
+# 2. cs -- current_stats(player)
+# 3. cb -- current_best(heap_name, k)
+def _op_n(problem, tokens, results, debug):
+    # Interned names make later dict probes and cache checks hit
+    # the pointer-equality fast path instead of rehashing
+    player = sys.intern(tokens[1])
+    hits = int(tokens[2])
+    rbi = int(tokens[3])
+    problem.new_at_bat(player, hits, rbi)
+
+
+def _op_cs(problem, tokens, results, debug):
+    player = sys.intern(tokens[1])
+    cs = problem.current_stats(player)
+    results.append(
+        ('cs', (cs.player, cs. ab, cs.hits, cs.avg, cs.rbi)))
+    if debug:
+        print(cs)
+
+
+def _op_cb(problem, tokens, results, debug):
+    heap_name = tokens[1]
+    k = int(tokens[2])
+    cb = problem.current_best(heap_name, k)
+    transformed_cb = [
+        (stat.player, stat.ab, stat.hits, stat.avg, stat.rbi)
+        for stat in cb]
+    results.append((('cb', heap_name), transformed_cb))
+    if debug:
+        print(cb)
+
+
+DISPATCH = {'n': _op_n, 'cs': _op_cs, 'cb': _op_cb}
 
 
 def run_from_list(line_list, debug=False):
@@ -354,43 +344,23 @@ def run_from_list(line_list, debug=False):
     line_list
 
     Args:
-        line_list: List of input lines
+        line_list: Iterable of input lines (a list or an open file)
 
     Returns:
         List of results
     """
     problem = Problem()
     results = list()
-    for line in line_list:
-        line = line.strip()
-        tokens = line.split('\t')
-        operation_type = tokens[0]
-        # Following operations allowed:
-        # 1. n -- new_at_bat(player, hits, rbi)
-        # 2. cs -- current_stats(player)
-        # 3. cb -- current_best(heap_name, k)
-        if (operation_type == 'n'):
-            player = tokens[1]
-            hits = int(tokens[2])
-            rbi = int(tokens[3])
-            problem.new_at_bat(player, hits, rbi)
-        elif (operation_type == 'cs'):
-            player = tokens[1]
-            cs = problem.current_stats(player)
-            results.append(
-                ('cs', (cs.player, cs. ab, cs.hits, cs.avg, cs.rbi)))
-            if debug:
-                print cs
-        elif (operation_type == 'cb'):
-            heap_name = tokens[1]
-            k = int(tokens[2])
-            cb = problem.current_best(heap_name, k)
-            transformed_cb = [
-                (stat.player, stat.ab, stat.hits, stat.avg, stat.rbi)
-                for stat in cb]
-            results.append((('cb', heap_name), transformed_cb))
-            if debug:
-                print cb
+    # Tokenize lazily so the dispatch loop below touches no string methods,
+    # only ready-made token lists, without holding every row's tokens at
+    # once. The maxsplit of 3 stops scanning once the widest row's fields
+    # are found
+    token_list = (line.rstrip('\n').split('\t', 3) for line in line_list)
+    dispatch_get = DISPATCH.get
+    for tokens in token_list:
+        handler = dispatch_get(tokens[0])
+        if handler is not None:
+            handler(problem, tokens, results, debug)
     return results
 
 
@@ -414,13 +384,17 @@ if __name__ == '__main__':
     parser.add_argument('--c', action='store_true')
     parser.add_argument('input_file')
     args = parser.parse_args()
-    input_lines, gold_processed_results, _ = pickle.load(open(args.input_file))
+    with open(args.input_file, 'rb') as f:
+        # The driver pickles were written by Python 2; latin-1 round-trips
+        # their byte strings unchanged
+        input_lines, gold_processed_results, _ = pickle.load(
+            f, encoding='latin1')
     if args.c:
         results = run_from_list(input_lines)
         processed_results = process_results(results)
         if processed_results != gold_processed_results:
-            print "TEST FAILED"
+            print("TEST FAILED")
         else:
-            print "TEST PASSED"
+            print("TEST PASSED")
     else:
         cProfile.run("run_from_list(input_lines)")